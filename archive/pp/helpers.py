@@ -1,14 +1,201 @@
 #helpers.py
 
-import mido
 from mido import MidiFile, MidiTrack, MidiFile
 import numpy as np
 import os
 import datetime
+from itertools import accumulate
 
 from pp import dicts
 
-def split_midi_by_track_named(input_file = None, input_midi: MidiFile = None, to_file=False):
+# Event type codes used in the `type_code` column of parse_midi_to_arrays
+NOTE_OFF = 0
+NOTE_ON = 1
+PROGRAM_CHANGE = 2
+CONTROL_CHANGE = 3
+TRACK_NAME = 4
+SET_TEMPO = 5
+TIME_SIGNATURE = 6
+KEY_SIGNATURE = 7
+OTHER_META = 8
+OTHER = 9
+
+TYPE_CODES = {
+    'note_off': NOTE_OFF,
+    'note_on': NOTE_ON,
+    'program_change': PROGRAM_CHANGE,
+    'control_change': CONTROL_CHANGE,
+    'track_name': TRACK_NAME,
+    'set_tempo': SET_TEMPO,
+    'time_signature': TIME_SIGNATURE,
+    'key_signature': KEY_SIGNATURE,
+}
+
+# Messages extract_measure carries over from before a measure: meta context and program/control state
+PRESERVE_CODES = np.array([TRACK_NAME, SET_TEMPO, TIME_SIGNATURE, KEY_SIGNATURE, PROGRAM_CHANGE, CONTROL_CHANGE], dtype=np.uint8)
+# Lookup table over all uint8 type codes, so the preserve test is a single gather
+_IS_PRESERVED = np.zeros(256, dtype=bool)
+_IS_PRESERVED[PRESERVE_CODES] = True
+
+# General MIDI family name for every program number (0-127), padded in case FAMILIES is shorter
+GM_PROGRAMS = np.array(dicts.FAMILIES + [f"Program_{i}" for i in range(len(dicts.FAMILIES), 128)])
+
+def parse_midi_to_arrays(input_file=None, input_midi: MidiFile = None) -> dict:
+    """
+    Parses a MIDI file once into flat (structure-of-arrays) numpy columns, one row per message.
+
+    Parameters:
+        input_file (str, optional): Path to the MIDI file.
+        input_midi (MidiFile, optional): Pre-loaded `mido.MidiFile` object.
+
+    Returns:
+        dict: Song arrays with the keys
+            'ticks_per_beat' (int), 'num_tracks' (int),
+            'track_id', 'abs_tick', 'channel', 'type_code', 'note', 'velocity', 'program' (np.ndarray),
+            'is_meta' (np.ndarray of bool), 'track_end_tick' (np.ndarray, last tick of each track)
+            and 'msgs' (list of the original mido messages).
+
+    Notes:
+        - If both `input_file` and `input_midi` are provided, `input_file` takes precedence.
+        - Rows are grouped by track and kept in file order, so `abs_tick` is sorted within each track.
+        - Fields that do not apply to a message (e.g. `note` on a meta message) are -1.
+        - `msgs` is only needed to rebuild `mido` objects (see `arrays_to_midi`); the
+          helpers in this module otherwise work on the numpy columns alone.
+    """
+    if input_file:
+        mid = MidiFile(input_file)
+    elif input_midi:
+        mid = input_midi
+    else:
+        raise ValueError("no input given")
+
+    msgs = []
+    track_id = []
+    abs_tick = []
+    track_end_tick = []
+    for i, track in enumerate(mid.tracks):
+        msgs.extend(track)
+        track_id.extend([i] * len(track))
+        abs_tick.extend(accumulate(msg.time for msg in track))
+        track_end_tick.append(abs_tick[-1] if len(track) else 0)
+
+    return {
+        'ticks_per_beat': mid.ticks_per_beat,
+        'num_tracks': len(mid.tracks),
+        'track_id': np.array(track_id, dtype=np.int32),
+        'abs_tick': np.array(abs_tick, dtype=np.int64),
+        'channel': np.array([getattr(msg, 'channel', -1) for msg in msgs], dtype=np.int8),
+        'type_code': np.array([TYPE_CODES.get(msg.type, OTHER_META if msg.is_meta else OTHER) for msg in msgs], dtype=np.uint8),
+        'note': np.array([getattr(msg, 'note', -1) for msg in msgs], dtype=np.int16),
+        'velocity': np.array([getattr(msg, 'velocity', -1) for msg in msgs], dtype=np.int16),
+        'program': np.array([getattr(msg, 'program', -1) for msg in msgs], dtype=np.int16),
+        'is_meta': np.array([msg.is_meta for msg in msgs], dtype=bool),
+        'track_end_tick': np.array(track_end_tick, dtype=np.int64),
+        'msgs': msgs,
+    }
+
+
+def _resolve_arrays(input_file=None, input_midi=None, input_arrays=None) -> dict:
+    # Same precedence as the rest of the module: file, then MidiFile, then pre-parsed arrays
+    if input_file or input_midi:
+        return parse_midi_to_arrays(input_file=input_file, input_midi=input_midi)
+    elif input_arrays is not None:
+        return input_arrays
+    else:
+        raise ValueError("no input given")
+
+
+def _track_offsets(song) -> np.ndarray:
+    # Rows are grouped by track, so track t occupies [offsets[t], offsets[t + 1]).
+    # Track 0 always gets bounds (empty if the file has no tracks) for the global meta lookups.
+    return np.searchsorted(song['track_id'], np.arange(max(song['num_tracks'], 1) + 1))
+
+
+def _take_events(song, idx, track_id=None, num_tracks=None) -> dict:
+    # Selects rows `idx` of every column, optionally relabelling the tracks they belong to
+    idx = np.asarray(idx)
+    if idx.dtype == bool:
+        idx = np.flatnonzero(idx)
+    return {
+        'ticks_per_beat': song['ticks_per_beat'],
+        'num_tracks': song['num_tracks'] if num_tracks is None else num_tracks,
+        'track_id': song['track_id'][idx] if track_id is None else track_id,
+        'abs_tick': song['abs_tick'][idx],
+        'channel': song['channel'][idx],
+        'type_code': song['type_code'][idx],
+        'note': song['note'][idx],
+        'velocity': song['velocity'][idx],
+        'program': song['program'][idx],
+        'is_meta': song['is_meta'][idx],
+        'msgs': [song['msgs'][i] for i in idx.tolist()],
+    }
+
+
+def _track_end_ticks(song) -> np.ndarray:
+    # Last absolute tick of every track (0 if empty). Stored by parse_midi_to_arrays,
+    # derived from the track offsets and cached for the sliced songs the other helpers build
+    if 'track_end_tick' not in song:
+        offsets = _track_offsets(song)[:song['num_tracks'] + 1]
+        non_empty = offsets[1:] > offsets[:-1]
+        track_end_tick = np.zeros(song['num_tracks'], dtype=np.int64)
+        track_end_tick[non_empty] = song['abs_tick'][offsets[1:][non_empty] - 1]
+        song['track_end_tick'] = track_end_tick
+    return song['track_end_tick']
+
+
+def _first_track0_msg(song, code):
+    # First message of the given type code in the global track 0, or None
+    offsets = _track_offsets(song)
+    idx = np.flatnonzero(song['type_code'][offsets[0]:offsets[1]] == code)
+    return song['msgs'][offsets[0] + idx[0]] if len(idx) else None
+
+
+def _preserve_rows(song) -> np.ndarray:
+    # Rows of the context messages extract_measure carries over from before a measure,
+    # computed once per song and cached on it
+    if '_preserve_rows' not in song:
+        song['_preserve_rows'] = np.flatnonzero(_IS_PRESERVED[song['type_code']])
+    return song['_preserve_rows']
+
+
+def _drum_partition(song):
+    # Drum rows (channel 9 outside track 0) and which tracks are drum tracks: any channel 9 message
+    # makes its whole track a drum track. Shared by split_midi_by_track_named and song_to_measure_pairs
+    drum_rows = (song['channel'] == 9) & (song['track_id'] > 0)
+    is_drum_track = np.zeros(song['num_tracks'], dtype=bool)
+    is_drum_track[song['track_id'][drum_rows]] = True
+    return drum_rows, is_drum_track
+
+
+def arrays_to_midi(song, shallow=False) -> MidiFile:
+    """
+    Rebuilds a `mido.MidiFile` from song arrays produced by `parse_midi_to_arrays`
+    (or by any helper in this module that returns song arrays).
+
+    Parameters:
+        song (dict): Song arrays.
+        shallow (bool): If True, messages whose delta time is unchanged are shared with the
+            source instead of copied. Only safe if neither side mutates them afterwards.
+
+    Returns:
+        MidiFile: A type 1 MIDI file with one track per track id, delta times recomputed from `abs_tick`.
+    """
+    mid = MidiFile(type=1)
+    mid.ticks_per_beat = song['ticks_per_beat']
+
+    offsets = _track_offsets(song)
+    for t in range(song['num_tracks']):
+        start, stop = offsets[t], offsets[t + 1]
+        deltas = np.diff(song['abs_tick'][start:stop], prepend=0)
+        track = MidiTrack()
+        for msg, delta in zip(song['msgs'][start:stop], deltas.tolist()):
+            track.append(msg if shallow and msg.time == delta else msg.copy(time=delta))
+        mid.tracks.append(track)
+
+    return mid
+
+
+def split_midi_by_track_named(input_file = None, input_midi: MidiFile = None, to_file=False, input_arrays=None, shallow=True):
     """
     Splits a MIDI file by track, identifying instruments and grouping notes accordingly.
 
@@ -20,30 +207,29 @@ def split_midi_by_track_named(input_file = None, input_midi: MidiFile = None, to
         input_file (str, optional): Path to the MIDI file to be split.
         input_midi (MidiFile, optional): Pre-loaded `mido.MidiFile` object.
         to_file (bool): If True, saves each resulting MIDI track to a separate file in a folder.
+        input_arrays (dict, optional): Song arrays from `parse_midi_to_arrays`.
+        shallow (bool): If True and `to_file` is False, the returned files share message objects
+            with the input and one global meta track between them, instead of copying.
 
     Returns:
-        List[MidiFile]: A list of `mido.MidiFile` objects, each containing one instrument. 
-        The last element is always the drum track, or None if there was no drum tack found
+        List[MidiFile]: A list of `mido.MidiFile` objects, each containing one instrument.
+        The last element is always the drum track, or None if there was no drum tack found.
+        If `input_arrays` is used, the list holds song arrays (two tracks: global meta, instrument) instead.
 
     Raises:
-        Exception: If neither `input_file` nor `input_midi` is provided.
+        Exception: If neither `input_file`, `input_midi` nor `input_arrays` is provided.
 
     Notes:
-        - Uses General MIDI instrument families from `dicts.FAMILIES` for naming.
+        - Uses General MIDI instrument families from `dicts.FAMILIES` (via `GM_PROGRAMS`) for naming.
         - Skips channel 9 tracks from the instrument loop and merges them into a single drum track.
         - Copies meta messages (like tempo and key signature) from the original global meta track (track 0).
         - Appends a numeric suffix (e.g., "_1") if multiple tracks use the same instrument name.
     """
 
-    GM_PROGRAMS = dicts.FAMILIES
+    song = _resolve_arrays(input_file, input_midi, input_arrays)
+    as_arrays = not (input_file or input_midi)
+    shallow = shallow and not to_file
 
-    if input_file:
-        mid = MidiFile(input_file)
-    elif input_midi:
-        mid = input_midi
-    else:
-        raise ValueError("no input given")
-    
     if to_file:
         # Create output folder
         try:
@@ -55,88 +241,99 @@ def split_midi_by_track_named(input_file = None, input_midi: MidiFile = None, to
 
         os.makedirs(output_folder, exist_ok=True)
 
-    global_meta_track = mid.tracks[0]
+    track_id = song['track_id']
+    offsets = _track_offsets(song)
+
+    global_meta_idx = np.flatnonzero((track_id == 0) & song['is_meta'])
     instrument_counts = {}
-    drum_track = MidiTrack()
-    has_drum_data = False
+    meta_track = None
+
+    # Any channel 9 message makes its track a drum track; all of them go to the drum track
+    drum_rows, is_drum_track = _drum_partition(song)
+    drum_idx = np.flatnonzero(drum_rows)
+
+    # First program change of every track (-1 if none); rows are grouped by track
+    program_change_rows = np.flatnonzero(song['type_code'] == PROGRAM_CHANGE)
+    tracks_with_program, first_rows = np.unique(track_id[program_change_rows], return_index=True)
+    first_program = np.full(song['num_tracks'], -1, dtype=np.int16)
+    first_program[tracks_with_program] = song['program'][program_change_rows[first_rows]]
 
     return_midis = []
 
-    for _, track in enumerate(mid.tracks[1:], start=1):
+    for t in range(1, song['num_tracks']):
+        start, stop = offsets[t], offsets[t + 1]
         instrument_name = "Unknown"
-        used_channels = set()
 
-        for msg in track:
-            if not msg.is_meta and hasattr(msg, 'channel'):
-                used_channels.add(msg.channel)
-
-        if 9 in used_channels:  # Drum track
-            for msg in track:
-                if not msg.is_meta and hasattr(msg, 'channel') and msg.channel == 9:
-                    drum_track.append(msg.copy())
-                    has_drum_data = True
+        if is_drum_track[t]:
             continue  # Skip writing this as a separate track
         else:
-            for msg in track:
-                if msg.type == 'program_change':
-                    instrument_name = GM_PROGRAMS[msg.program] if msg.program < len(GM_PROGRAMS) else f"Program_{msg.program}"
-                    break
+            if first_program[t] >= 0:
+                instrument_name = str(GM_PROGRAMS[first_program[t]])
 
             count = instrument_counts.get(instrument_name, 0)
             instrument_counts[instrument_name] = count + 1
             name_suffix = f"_{count}" if count > 0 else ""
             filename = f"{instrument_name.replace(' ', '_')}{name_suffix}.mid"
-            new_mid = MidiFile(type=1)
-            new_mid.ticks_per_beat = mid.ticks_per_beat
-
-            meta_track = MidiTrack()
-            for msg in global_meta_track:
-                if msg.is_meta:
-                    meta_track.append(msg.copy())
-            new_mid.tracks.append(meta_track)
 
-            new_track = MidiTrack()
-            for msg in track:
-                new_track.append(msg.copy())
-            new_mid.tracks.append(new_track)
+            new_song = _take_events(
+                song,
+                np.concatenate([global_meta_idx, np.arange(start, stop)]),
+                track_id=np.repeat(np.array([0, 1], dtype=np.int32), [len(global_meta_idx), stop - start]),
+                num_tracks=2,
+            )
 
-            return_midis.append(new_mid)
+            if as_arrays:
+                return_midis.append(new_song)
+            else:
+                new_mid = arrays_to_midi(new_song, shallow=shallow)
+                if shallow:
+                    # All splits share one global meta track
+                    if meta_track is None:
+                        meta_track = new_mid.tracks[0]
+                    new_mid.tracks[0] = meta_track
+                return_midis.append(new_mid)
 
             if to_file:
                 filepath = os.path.join(output_folder, filename)
-                new_mid.save(filepath)
+                arrays_to_midi(new_song).save(filepath)
                 print(f"Saved: {filepath}")
 
     # Save combined drum track, if any
-    if has_drum_data:
-        drum_mid = MidiFile(type=1)
-        drum_mid.ticks_per_beat = mid.ticks_per_beat
-
-        meta_track = MidiTrack()
-        for msg in global_meta_track:
-            if msg.is_meta:
-                meta_track.append(msg.copy())
-        drum_mid.tracks.append(meta_track)
-        drum_mid.tracks.append(drum_track)
-
-        return_midis.append(drum_mid)
+    if len(drum_idx):
+        # Drum tracks are merged in time order
+        drum_idx = drum_idx[np.argsort(song['abs_tick'][drum_idx], kind='stable')]
+        drum_song = _take_events(
+            song,
+            np.concatenate([global_meta_idx, drum_idx]),
+            track_id=np.repeat(np.array([0, 1], dtype=np.int32), [len(global_meta_idx), len(drum_idx)]),
+            num_tracks=2,
+        )
+
+        if as_arrays:
+            return_midis.append(drum_song)
+        else:
+            drum_mid = arrays_to_midi(drum_song, shallow=shallow)
+            if shallow and meta_track is not None:
+                drum_mid.tracks[0] = meta_track
+            return_midis.append(drum_mid)
 
         if to_file:
             drum_path = os.path.join(output_folder, "Drums.mid")
-            drum_mid.save(drum_path)
+            arrays_to_midi(drum_song).save(drum_path)
             print(f"Saved: {drum_path}")
     else:
         return_midis.append(None)
 
     return return_midis
 
-def count_measures(input_file=None, input_midi=None) -> int:
+def count_measures(input_file=None, input_midi=None, input_arrays=None) -> int:
     """
     Estimates the lower bound on the number of measures in a MIDI file.
 
     Parameters:
         input_file (str, optional): Path to the input MIDI file.
         input_midi (MidiFile, optional): A pre-loaded MidiFile object.
+        input_arrays (dict, optional): Song arrays from `parse_midi_to_arrays`.
 
     Returns:
         int: Estimated minimum number of measures in the file.
@@ -147,46 +344,24 @@ def count_measures(input_file=None, input_midi=None) -> int:
         - Tempo is not relevant for measure counting.
         - The returned value is a lower bound; actual number may be higher if longer time signatures are used later.
     """
-    if input_file:
-        mid = MidiFile(input_file)
-    elif input_midi:
-        mid = input_midi
-    else:
-        raise ValueError("no input given")
+    song = _resolve_arrays(input_file, input_midi, input_arrays)
 
-    ticks_per_beat = mid.ticks_per_beat
-    smallest_ticks_per_measure = None
-    current_numerator = 4
-    current_denominator = 4
+    ticks_per_beat = song['ticks_per_beat']
 
     # Track time signature changes
-    abs_tick = 0
-    for msg in mid.tracks[0]:
-        abs_tick += msg.time
-        if msg.type == 'time_signature':
-            current_numerator = msg.numerator
-            current_denominator = msg.denominator
-            # Calculate ticks per measure for this time signature
-            beats_per_measure = current_numerator
-            ticks_per_measure = beats_per_measure * ticks_per_beat
-            if smallest_ticks_per_measure is None or ticks_per_measure < smallest_ticks_per_measure:
-                smallest_ticks_per_measure = ticks_per_measure
+    time_sig_idx = np.flatnonzero((song['track_id'] == 0) & (song['type_code'] == TIME_SIGNATURE))
+    numerators = [song['msgs'][i].numerator for i in time_sig_idx.tolist()]
 
     # If no time signature found, assume default 4/4
-    if smallest_ticks_per_measure is None:
-        smallest_ticks_per_measure = 4 * ticks_per_beat
+    smallest_ticks_per_measure = min(numerators, default=4) * ticks_per_beat
 
-    # Find the longest track to estimate total song length
-    max_total_ticks = 0
-    for track in mid.tracks:
-        total_ticks = sum(msg.time for msg in track)
-        if total_ticks > max_total_ticks:
-            max_total_ticks = total_ticks
+    # The longest track gives the total song length
+    max_total_ticks = int(_track_end_ticks(song).max(initial=0))
 
     return max_total_ticks // smallest_ticks_per_measure
 
 
-def extract_measure(measure_num, input_file=None, input_midi=None, output_file=None, to_file=False) -> MidiFile:
+def extract_measure(measure_num, input_file=None, input_midi=None, output_file=None, to_file=False, input_arrays=None) -> MidiFile:
     """
     Extracts a single measure from a MIDI file and returns it as a new MidiFile object,
     preserving all relevant musical context (e.g., tempo, time signature, instruments)
@@ -198,49 +373,30 @@ def extract_measure(measure_num, input_file=None, input_midi=None, output_file=N
         input_midi (MidiFile, optional): A pre-loaded MidiFile object.
         output_file (str, optional): Path to save the extracted measure. Only used if to_file=True.
         to_file (bool): If True, saves the extracted measure to a MIDI file.
+        input_arrays (dict, optional): Song arrays from `parse_midi_to_arrays`.
 
     Returns:
         MidiFile: A new MidiFile object containing only the specified measure.
+        If `input_arrays` is used, song arrays of the measure are returned instead.
 
     Notes:
         - If both `input_file` and `input_midi` are provided, `input_file` takes precedence.
-        - Tempo and time signature are assumed to be found in track 0. If not found, defaults are used:
-            tempo = 500000 microseconds per beat (120 BPM),
-            time signature = 4/4.
+        - Time signature is assumed to be found in track 0. If not found, 4/4 is used.
         - The returned MIDI file retains the same number of tracks as the original,
           with each track clipped to the specified measure and with essential meta/program messages preserved.
+        - Preserved messages are placed at the start of the measure; all other messages keep
+          their position relative to the start of the measure.
     """
 
-    if input_file:
-        mid = MidiFile(input_file)
-    elif input_midi:
-        mid = input_midi
-    else:
-        raise ValueError("no input given")
+    song = _resolve_arrays(input_file, input_midi, input_arrays)
 
-    ticks_per_beat = mid.ticks_per_beat
-
-    # Defaults
-    tempo = 500000  # microseconds per beat (120 bpm)
-    numerator = 4
-    denominator = 4
-
-    time_sig_found = False
-    tempo_found = False
-
-    # Read global tempo and time signature (assume in track 0)
-    abs_time = 0
-    for msg in mid.tracks[0]:
-        abs_time += msg.time
-        if msg.type == 'time_signature' and not time_sig_found:
-            numerator = msg.numerator
-            denominator = msg.denominator
-            time_sig_found = True
-        elif msg.type == 'set_tempo' and not tempo_found:
-            tempo = msg.tempo
-            tempo_found = True
-        if time_sig_found and tempo_found:
-            break
+    ticks_per_beat = song['ticks_per_beat']
+    abs_tick = song['abs_tick']
+    offsets = _track_offsets(song)
+
+    # Read global time signature (assume in track 0), default 4/4
+    time_sig = _first_track0_msg(song, TIME_SIGNATURE)
+    numerator = time_sig.numerator if time_sig is not None else 4
 
     beats_per_measure = numerator
     ticks_per_measure = beats_per_measure * ticks_per_beat
@@ -248,50 +404,28 @@ def extract_measure(measure_num, input_file=None, input_midi=None, output_file=N
     start_tick = (measure_num - 1) * ticks_per_measure
     end_tick = start_tick + ticks_per_measure
 
-    # Prepare new midi file
-    new_mid = MidiFile()
-    new_mid.ticks_per_beat = ticks_per_beat
-
-    for track in mid.tracks:
-        abs_time = 0
-        new_track = MidiTrack()
-        new_mid.tracks.append(new_track)
-
-        running_tick = 0
-        buffered_msgs = []
-        last_tick = 0
-
-        for msg in track:
-            running_tick += msg.time
-
-            # Store messages before the measure that need to be preserved
-            if running_tick < start_tick:
-                if msg.is_meta and msg.type in ['track_name', 'set_tempo', 'time_signature', 'key_signature']:
-                    buffered_msgs.append((running_tick, msg.copy()))
-                elif not msg.is_meta and msg.type in ['program_change', 'control_change']:
-                    buffered_msgs.append((running_tick, msg.copy()))
-                continue
-
-            if running_tick >= end_tick:
-                break
-
-            # If first message in the range, insert buffered messages with adjusted delta times
-            if len(new_track) == 0:
-                # Insert the preserved messages with correct delta timing
-                buffered_msgs.sort(key=lambda x: x[0])
-                prev_tick = 0
-                for tick, m in buffered_msgs:
-                    copy = m.copy()
-                    copy.time = tick - prev_tick
-                    new_track.append(copy)
-                    prev_tick = tick
-
-                # Now set msg.time to be correct relative to start_tick
-                msg_copy = msg.copy()
-                msg_copy.time = running_tick - start_tick
-                new_track.append(msg_copy)
-            else:
-                new_track.append(msg.copy())
+    preserve_rows = _preserve_rows(song)
+    keep = []
+    preserved_counts = []
+
+    for t in range(song['num_tracks']):
+        start, stop = offsets[t], offsets[t + 1]
+        # abs_tick is sorted within a track, so the measure is one contiguous slice
+        lo, hi = start + np.searchsorted(abs_tick[start:stop], [start_tick, end_tick])
+        if lo == hi:
+            continue
+
+        # Messages before the measure that need to be preserved
+        p_lo, p_hi = np.searchsorted(preserve_rows, [start, lo])
+        keep.append(preserve_rows[p_lo:p_hi])
+        keep.append(np.arange(lo, hi))
+        preserved_counts += [p_hi - p_lo, hi - lo]
+
+    keep = np.concatenate(keep) if keep else np.zeros(0, dtype=np.int64)
+    preserved = np.repeat(np.arange(len(preserved_counts)) % 2 == 0, preserved_counts)
+
+    new_song = _take_events(song, keep)
+    new_song['abs_tick'] = np.where(preserved, 0, abs_tick[keep] - start_tick)
 
     if to_file:
         # Save output
@@ -299,75 +433,201 @@ def extract_measure(measure_num, input_file=None, input_midi=None, output_file=N
             base_name = os.path.splitext(os.path.basename(input_file))[0]
             output_file = f"{base_name}_measure_{measure_num}.mid"
 
-        new_mid.save(output_file)
+        arrays_to_midi(new_song).save(output_file)
         print(f"Saved: {output_file}")
-    
-    return new_mid
-
 
-def midi_to_velocity_matrix(input_file=None, input_midi=None, x=128, fs=1000, to_file=False, output_path=None):
+    if input_file or input_midi:
+        return arrays_to_midi(new_song)
+    return new_song
+
+
+def _ticks_per_second(song) -> float:
+    # Tempo is read once from the first set_tempo in track 0, default 120 BPM
+    set_tempo = _first_track0_msg(song, SET_TEMPO)
+    tempo = set_tempo.tempo if set_tempo is not None else 500000
+    return song['ticks_per_beat'] * (1_000_000 / tempo)
+
+
+def _fill_piano_rolls(piano_rolls, groups, notes, velocities, is_on, abs_ticks, time_steps):
+    # Pairs note events into notes and max-writes them into `piano_rolls` (shape: *groups, 128, x).
+    # `groups` holds one index array per leading axis; notes only pair within the same group.
+    x = piano_rolls.shape[-1]
+
+    # Group events by (groups, pitch), stable so each pitch stays in time order. Every note-on is
+    # closed by the next note-off of the same pitch, so overlapping (re-triggered) notes all
+    # sound; an unmatched note-on or note-off is ignored.
+    order = np.lexsort((abs_ticks, notes) + tuple(reversed(groups)))
+    groups = tuple(group[order] for group in groups)
+    notes, velocities, time_steps, is_on = notes[order], velocities[order], time_steps[order], is_on[order]
+
+    on_pos = np.flatnonzero(is_on)
+    off_pos = np.flatnonzero(~is_on)
+    next_off = np.searchsorted(off_pos, on_pos)
+    closed = next_off < len(off_pos)
+    on_pos, off_pos = on_pos[closed], off_pos[next_off[closed]]
+    same_note = notes[on_pos] == notes[off_pos]
+    for group in groups:
+        same_note &= group[on_pos] == group[off_pos]
+    on_pos, off_pos = on_pos[same_note], off_pos[same_note]
+
+    pitch = notes[on_pos]
+    start_steps = time_steps[on_pos]
+    end_steps = np.minimum(time_steps[off_pos], x)
+    note_velocities = velocities[on_pos]
+
+    # Each note becomes a (x,) row that holds its velocity where it sounds; rows are max-reduced
+    # straight into their pitch (a plain 0-127 index), so overlapping notes keep the louder one
+    valid = (start_steps < end_steps) & (pitch >= 0) & (pitch < 128)
+    index = tuple(group[on_pos][valid] for group in groups) + (pitch[valid],)
+    start_steps, end_steps = start_steps[valid], end_steps[valid]
+    note_velocities = note_velocities[valid].astype(np.uint8)
+
+    # Notes go in chunks of as many notes as the rolls have rows, so the (notes, x) temporaries
+    # stay within a few times the output's size however many notes there are
+    steps = np.arange(x)
+    chunk = max(piano_rolls.size // max(x, 1), 1)
+    for lo in range(0, len(note_velocities), chunk):
+        hi = lo + chunk
+        sounding = (steps >= start_steps[lo:hi, None]) & (steps < end_steps[lo:hi, None])
+        note_rows = np.where(sounding, note_velocities[lo:hi, None], np.uint8(0))
+        np.maximum.at(piano_rolls, tuple(i[lo:hi] for i in index), note_rows)
+
+
+def midi_to_velocity_matrix(input_file=None, input_midi=None, x=128, fs=1000, to_file=False, output_path=None, input_arrays=None, velocity=True):
     """
-    Converts a MIDI file object to a velocity matrix (piano roll) of size (128, x), where:
+    Converts a MIDI file object to a uint8 velocity matrix (piano roll) of size (128, x), where:
     - 128 is the number of MIDI pitches (notes)
     - x is the number of time steps
+    Song arrays from `parse_midi_to_arrays` may be given as `input_arrays` instead.
+    With `velocity=False` only note activity is kept, packed 8 steps per byte
+    (`np.packbits` along time): a uint8 matrix of size (128, ceil(x / 8)).
     """
-    if input_file is None and input_midi is None:
+    if input_file is None and input_midi is None and input_arrays is None:
         raise ValueError("Either input_file or input_midi must be provided")
 
     try:
-        midi_data = mido.MidiFile(input_file) if input_file else input_midi
+        song = _resolve_arrays(input_file, input_midi, input_arrays)
     except:
         raise ValueError("Unable to parse to MidiFile")
 
-    notes = []
-    is_drum = None
-    for track in midi_data.tracks:
-        for msg in track:
-            if msg.type in ('note_on', 'note_off'):
-                if not hasattr(msg, 'channel'):
-                    continue
-                drum_status = (msg.channel == 9)
-                if is_drum is None:
-                    is_drum = drum_status
-                elif is_drum != drum_status:
-                    raise ValueError("MIDI contains both drum and non-drum tracks")
-                notes.append((msg.note, msg.velocity, msg.time, msg.type == 'note_on'))
-
-    total_ticks = sum(msg[2] for msg in notes)
-    tempo = getattr(midi_data, 'tempo', 500000)  # default 120 BPM
-    ticks_per_second = midi_data.ticks_per_beat * (1_000_000 / tempo)
-    total_time = total_ticks / ticks_per_second
-    num_steps = int(total_time * fs)
-
-    piano_roll_full = np.zeros((128, num_steps), dtype=np.int8)
-
-    current_time = 0
-    active_notes = {}
-
-    for note, velocity, delta_time, is_note_on in notes:
-        current_time += delta_time
-        time_step = int((current_time / ticks_per_second) * fs)
-
-        if is_note_on and velocity > 0:
-            active_notes[note] = (time_step, velocity)
-        elif note in active_notes:
-            start_step, note_velocity = active_notes[note]
-            end_step = time_step
-            if start_step < end_step and 0 <= note < 128:
-                piano_roll_full[note, start_step:end_step] = note_velocity
-            del active_notes[note]
-
-    # Final piano roll (shape: 128 x x)
-    T = piano_roll_full.shape[1]
-    if T >= x:
-        piano_roll = piano_roll_full[:, :x]
-    else:
-        piano_roll = np.zeros((128, x), dtype=np.int8)
-        piano_roll[:, :T] = piano_roll_full
+    type_code = song['type_code']
+    channel = song['channel']
+
+    note_idx = np.flatnonzero(((type_code == NOTE_ON) | (type_code == NOTE_OFF)) & (channel >= 0))
+    drum_status = channel[note_idx] == 9
+    if drum_status.any() and not drum_status.all():
+        raise ValueError("MIDI contains both drum and non-drum tracks")
+
+    notes = song['note'][note_idx].astype(np.int32)
+    velocities = song['velocity'][note_idx].astype(np.int32)
+    abs_ticks = song['abs_tick'][note_idx]
+    is_on = (type_code[note_idx] == NOTE_ON) & (velocities > 0)
+
+    tick_to_step = fs / _ticks_per_second(song)
+
+    # Only the first x steps are ever returned, so only those are allocated (shape: 128 x x)
+    piano_roll = np.zeros((128, x), dtype=np.uint8)
+
+    time_steps = (abs_ticks * tick_to_step).astype(np.int32)
+    _fill_piano_rolls(piano_roll, (), notes, velocities, is_on, abs_ticks, time_steps)
+
+    if not velocity:
+        piano_roll = np.packbits(piano_roll > 0, axis=1)
 
     if to_file:
         if output_path is None:
             output_path = "./outputs/" + ('velocity_matrix.npy' if input_file is None else input_file + '_velocity.npy')
         np.save(output_path, piano_roll)
 
-    return piano_roll
\ No newline at end of file
+    return piano_roll
+
+
+def song_to_measure_pairs(input_file=None, input_midi=None, input_arrays=None, x=64, fs=1000, velocity=True):
+    """
+    Converts a whole song into (instrument, drum) velocity matrix pairs, one pair per instrument
+    per measure, in a single pass over its events.
+
+    This is equivalent to splitting the song with `split_midi_by_track_named`, slicing every
+    measure out of each split track with `extract_measure` and converting each slice with
+    `midi_to_velocity_matrix`, without building any of the intermediate songs: every note event is
+    tagged with its measure and instrument and all piano rolls are filled at once.
+
+    Parameters:
+        input_file (str, optional): Path to the MIDI file.
+        input_midi (MidiFile, optional): A pre-loaded MidiFile object.
+        input_arrays (dict, optional): Song arrays from `parse_midi_to_arrays`.
+        x (int): Number of time steps per matrix.
+        fs (int): Time steps per second.
+        velocity (bool): If False, matrices are bit-packed note activity (see `midi_to_velocity_matrix`).
+
+    Returns:
+        (np.ndarray, np.ndarray): Stacked instrument matrices and the matching drum matrices,
+        each of shape (num_pairs, 128, x), or (num_pairs, 128, ceil(x / 8)) with velocity=False,
+        ordered by measure then instrument.
+        None if the song has no drum track, no instrument track or no measure with drums.
+
+    Notes:
+        - Instruments and drums are partitioned as in `split_midi_by_track_named`.
+        - Measures follow `count_measures` and `extract_measure` (first time signature in track 0);
+          notes only pair up within a measure.
+        - Tempo is the first set_tempo in track 0 for the whole song, default 120 BPM.
+        - Measures without drum events are skipped.
+    """
+    song = _resolve_arrays(input_file, input_midi, input_arrays)
+    if song['num_tracks'] == 0:
+        return None
+
+    track_id = song['track_id']
+    abs_tick = song['abs_tick']
+    channel = song['channel']
+    type_code = song['type_code']
+
+    num_measures = count_measures(input_arrays=song)
+    time_sig = _first_track0_msg(song, TIME_SIGNATURE)
+    ticks_per_measure = (time_sig.numerator if time_sig is not None else 4) * song['ticks_per_beat']
+    tick_to_step = fs / _ticks_per_second(song)
+
+    drum_rows, is_drum_track = _drum_partition(song)
+    instrument_tracks = np.flatnonzero(~is_drum_track[1:]) + 1
+    num_instruments = len(instrument_tracks)
+
+    # Voice of each track: its instrument index, with all drum tracks merged into the last voice
+    voice_of_track = np.full(song['num_tracks'], num_instruments)
+    voice_of_track[0] = -1
+    voice_of_track[instrument_tracks] = np.arange(num_instruments)
+
+    measure = abs_tick // ticks_per_measure
+    has_drums = np.zeros(num_measures, dtype=bool)
+    has_drums[measure[drum_rows & (measure < num_measures)]] = True
+    if num_instruments == 0 or not has_drums.any():
+        return None
+
+    # Only measures with drums get a slot in the output
+    slot_of_measure = np.cumsum(has_drums) - 1
+    voice = voice_of_track[track_id]
+    is_note = ((type_code == NOTE_ON) | (type_code == NOTE_OFF)) & (channel >= 0)
+    rows = np.flatnonzero(
+        is_note
+        & (voice >= 0)
+        & (~is_drum_track[track_id] | drum_rows)
+        & (measure < num_measures)
+    )
+    rows = rows[has_drums[measure[rows]]]
+
+    notes = song['note'][rows].astype(np.int32)
+    velocities = song['velocity'][rows].astype(np.int32)
+    is_on = (type_code[rows] == NOTE_ON) & (velocities > 0)
+    time_steps = ((abs_tick[rows] - measure[rows] * ticks_per_measure) * tick_to_step).astype(np.int32)
+
+    piano_rolls = np.zeros((int(has_drums.sum()), num_instruments + 1, 128, x), dtype=np.uint8)
+    _fill_piano_rolls(
+        piano_rolls, (slot_of_measure[measure[rows]], voice[rows]),
+        notes, velocities, is_on, abs_tick[rows], time_steps,
+    )
+
+    if not velocity:
+        piano_rolls = np.packbits(piano_rolls > 0, axis=-1)
+
+    inputs = piano_rolls[:, :num_instruments].reshape(len(piano_rolls) * num_instruments, 128, piano_rolls.shape[-1])
+    outputs = np.repeat(piano_rolls[:, num_instruments], num_instruments, axis=0)
+    return inputs, outputs
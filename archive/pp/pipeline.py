@@ -23,7 +23,7 @@ from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Assuming your helper functions are in a 'pp' package
 # Make sure these functions are robust and don't have their own memory leaks.
-from pp.helpers import count_measures, extract_measure, split_midi_by_track_named, midi_to_velocity_matrix
+from pp.helpers import count_measures, extract_measure, split_midi_by_track_named, midi_to_velocity_matrix, parse_midi_to_arrays
 
 # --- Configuration ---
 # Use a hidden directory for temporary files generated by worker processes
@@ -52,7 +52,7 @@ def data_from_song_pipeline(input_file: Optional[str] = None, input_midi=None) -
     This is a GENERATOR, yielding pairs one by one to keep memory usage minimal.
 
     The pipeline steps are:
-    1. Count measures in the song.
+    1. Parse the song once and count its measures.
     2. For each measure:
        a. Extract the measure as a new MIDI object.
        b. Split the measure into instrument tracks and a drum track.
@@ -60,7 +60,8 @@ def data_from_song_pipeline(input_file: Optional[str] = None, input_midi=None) -
        d. Yield a (non_drum_matrix, drum_matrix) pair for each valid instrument.
     """
     try:
-        num_measures = count_measures(input_file=input_file, input_midi=input_midi)
+        song = parse_midi_to_arrays(input_file=input_file, input_midi=input_midi)
+        num_measures = count_measures(input_arrays=song)
         if num_measures is None or num_measures == 0:
             return
     except Exception as e:
@@ -72,16 +73,16 @@ def data_from_song_pipeline(input_file: Optional[str] = None, input_midi=None) -
 
     for measure_num in range(1, num_measures + 1):
         try:
-            measure_midi = extract_measure(measure_num, input_file=input_file, input_midi=input_midi)
-            if not measure_midi:
+            measure_song = extract_measure(measure_num, input_arrays=song)
+            if not measure_song:
                 continue
 
-            split_tracks = split_midi_by_track_named(input_midi=measure_midi)
+            split_tracks = split_midi_by_track_named(input_arrays=measure_song)
             if not split_tracks or split_tracks[-1] is None:
                 continue  # Skip measures without a drum track
 
             drum_track_midi = split_tracks[-1]
-            drum_matrix = midi_to_velocity_matrix(input_midi=drum_track_midi, x=matrix_dim_x)
+            drum_matrix = midi_to_velocity_matrix(input_arrays=drum_track_midi, x=matrix_dim_x)
 
             if drum_matrix is None:
                 continue
@@ -90,7 +91,7 @@ def data_from_song_pipeline(input_file: Optional[str] = None, input_midi=None) -
                 if instrument_track_midi is None:
                     continue
 
-                inst_matrix = midi_to_velocity_matrix(input_midi=instrument_track_midi, x=matrix_dim_x)
+                inst_matrix = midi_to_velocity_matrix(input_arrays=instrument_track_midi, x=matrix_dim_x)
 
                 if inst_matrix is not None and inst_matrix.size > 0:
                     yield (inst_matrix, drum_matrix)
@@ -1,7 +1,7 @@
 # --- START OF FILE process_artist.py ---
 
 # Does midi processing on a single artist (subdirectory)
-# Converts subdirectory including a list of midi files into a .pt dataset 
+# Converts subdirectory including a list of midi files into a numpy dataset (<output>.inputs.npy / <output>.outputs.npy)
 # Dataset consists of inputs (non drum track) and outputs (drum track)
 # Each input/output is a numpy matrix corresponding to one measure of one instrument of one track
 # If there are multiple non drum instruments in one midi track, there will be one pair for each one
@@ -9,6 +9,7 @@
 
 import argparse
 import gc
+import multiprocessing
 import os
 
 import sys
@@ -18,45 +19,59 @@ import numpy as np
 import torch
 
 # Assuming your helper functions are in a 'pp' package
-from pp.helpers import count_measures, extract_measure, midi_to_velocity_matrix, split_midi_by_track_named
+from pp.helpers import song_to_measure_pairs
 
-# The data_from_song_pipeline function remains unchanged.
-# I'm including it here for completeness.
+def data_from_song_pipeline(input_file=None, input_midi=None, to_file=False, velocity=True):
+    """
+    Processes a MIDI file into paired velocity matrices in a single pass over its events (see song_to_measure_pairs).
+    Drum tracks are partitioned once per song, and only measures with channel 9 events produce pairs.
+    With velocity=False the matrices are bit-packed note activity (see midi_to_velocity_matrix).
 
-def data_from_song_pipeline(input_file=None, input_midi=None, to_file=False):
-    """Processes a MIDI file into paired velocity matrices."""
+    Returns:
+        (inputs, outputs): Two stacked arrays of shape (num_pairs, 128, x), or (num_pairs, 128, ceil(x / 8))
+        with velocity=False, holding the instrument and drum matrices of each pair; None if the song yields no pairs.
+    """
     try:
-        num_measures = count_measures(input_file=input_file, input_midi=input_midi)
+        return song_to_measure_pairs(input_file=input_file, input_midi=input_midi, x=64, velocity=velocity)
     except Exception:
-        return []
-
-    all_data_pairs = []
-    for measure_num in range(1, num_measures + 1):
-        try:
-            measure_midi = extract_measure(measure_num, input_file=input_file, input_midi=input_midi, to_file=False)
-            split_tracks = split_midi_by_track_named(input_file=None, input_midi=measure_midi, to_file=False)
-            if not split_tracks or split_tracks[-1] is None: continue
-            
-            drum_track = split_tracks[-1]
-            drum_matrix = midi_to_velocity_matrix(input_midi=drum_track, x=64, to_file=False)
-
-            for instrument_track in split_tracks[:-1]:
-                if instrument_track is None: continue
-                inst_matrix = midi_to_velocity_matrix(input_midi=instrument_track, x=64, to_file=False)
-                if inst_matrix is None or inst_matrix.size == 0: continue
-                all_data_pairs.append((inst_matrix, drum_matrix))
-        except Exception:
-            continue
-    return all_data_pairs
-
-
-def process_and_save_artist_incrementally(artist_folder_path: str, output_file_path: str):
+        return None
+
+
+def _process_song(job):
+    """Pool worker: runs the song pipeline for one (file_path, velocity) job and never raises."""
+    file_path, velocity = job
+    try:
+        return file_path, data_from_song_pipeline(input_file=file_path, velocity=velocity), None
+    except Exception as e:
+        return file_path, None, e
+
+
+def _write_npy_header(f, shape, dtype):
+    """(Re)writes the .npy header at the start of `f`. numpy pads it so the first axis can grow in place."""
+    f.seek(0)
+    np.lib.format.write_array_header_1_0(f, {
+        'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+        'fortran_order': False,
+        'shape': tuple(shape),
+    })
+
+
+def process_and_save_artist_incrementally(artist_folder_path: str, output_file_path: str, velocity: bool = True, num_workers: int = None):
     """
     Processes all MIDI files for an artist and saves the results incrementally
     to keep memory usage low.
+
+    Songs are processed in parallel by `num_workers` processes (default: all CPUs).
+    Pairs are appended to two .npy files, `<output_file_path>.inputs.npy` (instrument matrices)
+    and `<output_file_path>.outputs.npy` (drum matrices), as soon as each song's result arrives;
+    nothing is ever read back. The headers are patched with the final pair count at the end, and the
+    files only get their final names once complete (`.tmp` until then, removed if the run fails).
+    Use `load_artist_dataset` to memory-map them.
     """
     artist_name = os.path.basename(artist_folder_path)
-    midi_files = [f for f in os.listdir(artist_folder_path) if f.lower().endswith(('.mid', '.midi'))]
+    # One scandir pass; DirEntry caches the file type, so no extra stat per file
+    with os.scandir(artist_folder_path) as it:
+        midi_files = [e.path for e in it if e.is_file() and e.name.lower().endswith(('.mid', '.midi'))]
     
     if not midi_files:
         print(f"No MIDI files found for artist: {artist_name}")
@@ -64,49 +79,74 @@ def process_and_save_artist_incrementally(artist_folder_path: str, output_file_p
 
     print(f"Processing {len(midi_files)} songs for artist: {artist_name}")
     
-    # This flag tracks if we've created the initial output file yet.
-    file_created = False
     total_pairs = 0
+    jobs = [(file_path, velocity) for file_path in midi_files]
+
+    inputs_path = f"{output_file_path}.inputs.npy"
+    outputs_path = f"{output_file_path}.outputs.npy"
+    # Written under temporary names and renamed only once complete, so a run that dies part way
+    # never leaves files that look finished (run_pipeline_broken.sh skips artists whose files exist)
+    inputs_tmp_path = f"{inputs_path}.tmp"
+    outputs_tmp_path = f"{outputs_path}.tmp"
+    row_shape = None
+    row_dtype = None
 
-    for i, filename in enumerate(midi_files):
-        print(f"  - Song {i+1}/{len(midi_files)}: {filename}")
-        file_path = os.path.join(artist_folder_path, filename)
-        if not os.path.isfile(file_path):
-            continue
-
-        try:
-            # 1. Process one song to get its data
-            song_data = data_from_song_pipeline(input_file=file_path)
-            
-            if not song_data:
-                print(f"    -> No valid pairs found.")
-                continue
-
-            # 2. Load, Extend, Save cycle
-            if not file_created:
-                # This is the first song with data, create the file.
-                torch.save(song_data, output_file_path)
-                file_created = True
-                print(f"    -> Found {len(song_data)} pairs. Created new file.")
-            else:
-                # File already exists, perform the load-extend-save cycle.
-                
-                existing_data = torch.load(output_file_path, weights_only=False)
-                existing_data.extend(song_data)
-                torch.save(existing_data, output_file_path)
-                
-                # Explicitly free memory
-                del existing_data
-                print(f"    -> Found {len(song_data)} pairs. Appended to existing file.")
-
-            total_pairs += len(song_data)
-            del song_data
-            gc.collect()
-
-        except Exception as e:
-            print(f"    -> CRITICAL ERROR processing song {filename}: {e}")
-            # Continue to the next song to make the process resilient
-            continue
+    try:
+        with open(inputs_tmp_path, 'wb') as inputs_file, open(outputs_tmp_path, 'wb') as outputs_file:
+            with multiprocessing.Pool(num_workers or os.cpu_count()) as pool:
+                for done, (file_path, song_data, error) in enumerate(pool.imap_unordered(_process_song, jobs, chunksize=4), start=1):
+                    filename = os.path.basename(file_path)
+                    print(f"  - Song {done}/{len(jobs)}: {filename}")
+
+                    if error is not None:
+                        print(f"    -> CRITICAL ERROR processing song {filename}: {error}")
+                        # Continue to the next song to make the process resilient
+                        continue
+
+                    if song_data is None:
+                        print(f"    -> No valid pairs found.")
+                        continue
+
+                    inputs_end = outputs_end = None
+                    try:
+                        inputs, outputs = song_data
+
+                        if row_shape is None:
+                            row_shape, row_dtype = inputs.shape[1:], inputs.dtype
+                            _write_npy_header(inputs_file, (0,) + row_shape, row_dtype)
+                            _write_npy_header(outputs_file, (0,) + row_shape, row_dtype)
+
+                        # Append-only: raw rows go right after the ones already on disk
+                        inputs_end, outputs_end = inputs_file.tell(), outputs_file.tell()
+                        inputs_file.write(inputs.tobytes())
+                        outputs_file.write(outputs.tobytes())
+                        print(f"    -> Found {len(inputs)} pairs. Appended to {inputs_path}.")
+                    except Exception as e:
+                        print(f"    -> CRITICAL ERROR saving song {filename}: {e}")
+                        if inputs_end is not None:
+                            # Drop the song's partial rows so both files keep the same row count
+                            for f, end in ((inputs_file, inputs_end), (outputs_file, outputs_end)):
+                                f.truncate(end)
+                                f.seek(end)
+                        continue
+
+                    total_pairs += len(inputs)
+                    del song_data, inputs, outputs
+                    gc.collect()
+
+            if row_shape is not None:
+                _write_npy_header(inputs_file, (total_pairs,) + row_shape, row_dtype)
+                _write_npy_header(outputs_file, (total_pairs,) + row_shape, row_dtype)
+
+        if total_pairs > 0:
+            # inputs last: its presence marks a finished artist
+            os.replace(outputs_tmp_path, outputs_path)
+            os.replace(inputs_tmp_path, inputs_path)
+    finally:
+        # Anything left under a temporary name is from a failed or empty run
+        for path in (inputs_tmp_path, outputs_tmp_path):
+            if os.path.exists(path):
+                os.remove(path)
 
     if total_pairs > 0:
         print(f"Finished artist {artist_name}. Total pairs extracted: {total_pairs}")
@@ -114,17 +154,36 @@ def process_and_save_artist_incrementally(artist_folder_path: str, output_file_p
         print(f"Finished artist {artist_name}. No valid data was extracted.")
 
 
+def load_artist_dataset(output_file_path: str):
+    """Memory-maps the (inputs, outputs) arrays written for `output_file_path`; only touched pages are read."""
+    inputs = np.load(f"{output_file_path}.inputs.npy", mmap_mode='r')
+    outputs = np.load(f"{output_file_path}.outputs.npy", mmap_mode='r')
+    return inputs, outputs
+
+
+def unpack_piano_roll_bits(bits: torch.Tensor) -> torch.Tensor:
+    """
+    Unpacks bit-packed piano rolls (velocity=False) back to 0/1 along the last axis,
+    on whatever device `bits` lives on, e.g. (N, 128, 8) uint8 -> (N, 128, 64) uint8.
+    """
+    weights = torch.tensor([128, 64, 32, 16, 8, 4, 2, 1], dtype=torch.uint8, device=bits.device)
+    unpacked = torch.bitwise_and(bits.unsqueeze(-1), weights).ne(0)
+    return unpacked.flatten(-2).to(torch.uint8)
+
+
 def main():
     parser = argparse.ArgumentParser(description="Process MIDI files for one artist with low memory usage.")
     parser.add_argument("--artist-dir", type=str, required=True, help="Path to the artist's MIDI directory.")
-    parser.add_argument("--output-file", type=str, required=True, help="Path for the final .pt output file.")
+    parser.add_argument("--output-file", type=str, required=True, help="Base path for the output arrays (<path>.inputs.npy and <path>.outputs.npy).")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: all CPUs).")
+    parser.add_argument("--no-velocity", action="store_true", help="Store bit-packed note activity instead of velocities (8x smaller).")
     args = parser.parse_args()
 
     artist_name = os.path.basename(args.artist_dir)
     print(f"\n--- Starting processing for artist: {artist_name} ---")
 
     try:
-        process_and_save_artist_incrementally(args.artist_dir, args.output_file)
+        process_and_save_artist_incrementally(args.artist_dir, args.output_file, velocity=not args.no_velocity, num_workers=args.workers)
     except Exception as e:
         print(f"!!! A fatal error occurred for artist {artist_name}: {e}")
         exit(1)
@@ -69,8 +69,8 @@ for folder in "$INPUT_DIR"/*; do
         # Get just the name of the folder (e.g., "mc_1") from the full path
         artist_name=$(basename "$folder")
         
-        # Construct the full path for the output file in the specified OUTPUT_DIR
-        output_file="$OUTPUT_DIR/artist_${artist_name}.pt"
+        # Construct the base path for the output arrays (<base>.inputs.npy / <base>.outputs.npy) in OUTPUT_DIR
+        output_file="$OUTPUT_DIR/artist_${artist_name}"
         
         echo ""
         echo "Processing artist folder: $artist_name"
@@ -19,6 +19,12 @@ MAX_JOBS=4 # Number of parallel jobs
 # For example, if you have 16GB free, 4GB per process is safe for 4 jobs.
 MEMORY_LIMIT_KB=4194304
 
+# --- WORKERS PER JOB ---
+# Each job runs a pool of song workers; split the CPUs between the MAX_JOBS jobs
+# so that running them all at once does not oversubscribe the machine.
+WORKERS_PER_JOB=$(( $(getconf _NPROCESSORS_ONLN) / MAX_JOBS ))
+[ "$WORKERS_PER_JOB" -ge 1 ] || WORKERS_PER_JOB=1
+
 # --- Script Logic ---
 set -eu
 
@@ -37,6 +43,7 @@ echo "✅ Output will be saved to: $OUTPUT_DIR"
 echo "✅ All detailed logs will be appended to: $MASTER_LOG_FILE"
 echo "✅ Parallel jobs limited to: $MAX_JOBS"
 echo "✅ Memory limit per job set to: $((MEMORY_LIMIT_KB / 1024)) MB"
+echo "✅ Worker processes per job: $WORKERS_PER_JOB"
 
 # --- THIS IS THE MEMORY-SAFE SOLUTION ---
 TOTAL_ARTISTS=$(find "$INPUT_DIR" -mindepth 1 -maxdepth 1 -type d | wc -l | xargs)
@@ -57,9 +64,11 @@ find "$INPUT_DIR" -mindepth 1 -maxdepth 1 -type d | while read -r artist_path; d
     # Now that we know there's a free slot, launch the next job.
     PROCESSED_COUNT=$((PROCESSED_COUNT + 1))
     artist_name=$(basename "$artist_path")
-    output_pt_file="$OUTPUT_DIR/${artist_name}.pt"
+    # Base path for the output arrays (<base>.inputs.npy / <base>.outputs.npy); process_artist.py
+    # only gives them these names once the artist is complete, so their presence means finished
+    output_file="$OUTPUT_DIR/artist_${artist_name}"
 
-    if [ -f "$output_pt_file" ]; then
+    if [ -f "${output_file}.inputs.npy" ]; then
         echo "[$PROCESSED_COUNT/$TOTAL_ARTISTS] ⏭️  SKIPPING: ${artist_name} (output already exists)"
         continue
     fi
@@ -69,7 +78,7 @@ find "$INPUT_DIR" -mindepth 1 -maxdepth 1 -type d | while read -r artist_path; d
         echo "[$PROCESSED_COUNT/$TOTAL_ARTISTS] 🚀 STARTING: ${artist_name}"
         ulimit -v $MEMORY_LIMIT_KB
         LOG_FILE="${OUTPUT_DIR}/artist-${artist_name}.log"
-        "$PYTHON_EXEC" process_artist.py --artist-dir "$artist_path" --output-file "$output_pt_file" >> "$LOG_FILE" 2>&1
+        "$PYTHON_EXEC" process_artist.py --artist-dir "$artist_path" --output-file "$output_file" --workers "$WORKERS_PER_JOB" >> "$LOG_FILE" 2>&1
         if [ $? -eq 0 ]; then
             echo "[$PROCESSED_COUNT/$TOTAL_ARTISTS] ✅ FINISHED: ${artist_name}"
         else